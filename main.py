@@ -1,4 +1,15 @@
+import os
+
 import uvicorn
 
 if __name__ == "__main__":
-    uvicorn.run("server:app", host="0.0.0.0", port=5000)
+    uvicorn.run(
+        "server:create_app",
+        factory=True,
+        host="0.0.0.0",
+        port=5000,
+        loop="uvloop",
+        http="httptools",
+        # os.cpu_count() ziet in containers de host-cores; elke worker heeft zijn eigen pool en cache
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+    )
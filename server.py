@@ -1,35 +1,78 @@
+import asyncio
 import os
-import json
-from typing import Optional, Literal, Dict, Any
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Optional, Literal, Dict, Any, List
+from urllib.parse import urlencode
 
 import httpx
-from fastapi import FastAPI
-from fastmcp import FastMCP
+import orjson
+from cachetools import TTLCache
 
 # === Config ===
-UITDB_BASE = "https://search-test.uitdatabank.be"  # basis voor Search API (events/places/organizers)
+# basis voor Search API (events/places/organizers); prod = https://search.uitdatabank.be
+UITDB_BASE = os.getenv("UITDB_BASE", "https://search-test.uitdatabank.be")
 
 # Pak secrets uit omgeving
 UITDB_CLIENT_ID = os.getenv("UITDB_CLIENT_ID")
+UITDB_API_KEY = os.getenv("UITDB_API_KEY")
 
-# === MCP server ===
-mcp = FastMCP("uitdb")
+# Gedeelde HTTP client (keep-alive + HTTP/2), opgezet en gesloten in de app lifespan
+_CLIENT: Optional[httpx.AsyncClient] = None
 
-def _auth_params_and_headers() -> tuple[Dict[str, Any], Dict[str, str]]:
+# Auth via client id en/of API key: vast voor de hele levensduur van het proces, dus één keer opbouwen.
+# - Als client id aanwezig: stuur als x-client-id header én als clientId queryparam.
+# - Als API key aanwezig: stuur enkel als x-api-key header (niet in de URL, die belandt in logs).
+_AUTH_PARAMS: Dict[str, Any] = {"clientId": UITDB_CLIENT_ID} if UITDB_CLIENT_ID else {}
+_AUTH_HEADERS: Dict[str, str] = {
+    "Accept": "application/json",
+    **({"x-client-id": UITDB_CLIENT_ID} if UITDB_CLIENT_ID else {}),
+    **({"x-api-key": UITDB_API_KEY} if UITDB_API_KEY else {}),
+}
+# Vaste prefix van de querystring (auth + embed=true voor volledige event details i.p.v. referenties)
+_BASE_QS = urlencode({**_AUTH_PARAMS, "embed": "true"})
+
+# Cache voor identieke zoekopdrachten: key -> Future met (items, meta) uit _uitdb_fetch,
+# d.w.z. de resultatenlijst en de top-level velden zonder items/member/results.
+# Gelijktijdige identieke requests delen dezelfde Future (single-flight).
+_SEARCH_CACHE: TTLCache = TTLCache(maxsize=512, ttl=60)
+
+# Bovengrens voor het aantal pagina's dat search_uit in één call parallel ophaalt
+_MAX_PAGES = 10
+# Bovengrens voor het aantal items per pagina
+_MAX_LIMIT = 100
+
+async def _uitdb_search(
+    endpoint: Literal["events", "places", "organizers"],
+    q: Optional[str] = None,
+    limit: int = 10,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    city: Optional[str] = None,
+    page: int = 1,
+) -> tuple[List[Any], Dict[str, Any]]:
     """
-    Bepaal auth via client id.
-    - Als client id aanwezig: stuur als x-client-id header én als clientId queryparam.
+    Gecachte variant van _uitdb_fetch (LRU + TTL van 60s).
+    Mislukte requests worden niet gecachet. Het resultaat wordt gedeeld
+    tussen callers en mag dus niet gemuteerd worden.
     """
-    params: Dict[str, Any] = {}
-    headers: Dict[str, str] = {"Accept": "application/json"}
+    key = (endpoint, q, start, end, city, page, limit)
+    fut = _SEARCH_CACHE.get(key)
+    if fut is None:
+        fut = asyncio.ensure_future(
+            _uitdb_fetch(endpoint, q=q, limit=limit, start=start, end=end, city=city, page=page)
+        )
+        _SEARCH_CACHE[key] = fut
 
-    if UITDB_CLIENT_ID:
-        headers["x-client-id"] = UITDB_CLIENT_ID
-        params["clientId"] = UITDB_CLIENT_ID
+        def _evict_on_error(f: asyncio.Future) -> None:
+            if (f.cancelled() or f.exception() is not None) and _SEARCH_CACHE.get(key) is f:
+                del _SEARCH_CACHE[key]
 
-    return params, headers
+        fut.add_done_callback(_evict_on_error)
+    # shield: een geannuleerde caller mag de gedeelde fetch niet annuleren
+    return await asyncio.shield(fut)
 
-async def _uitdb_search(
+async def _uitdb_fetch(
     endpoint: Literal["events", "places", "organizers"],
     q: Optional[str] = None,
     limit: int = 10,
@@ -37,61 +80,87 @@ async def _uitdb_search(
     end: Optional[str] = None,
     city: Optional[str] = None,
     page: int = 1,
-) -> Dict[str, Any]:
+) -> tuple[List[Any], Dict[str, Any]]:
     """
     Minimalistische wrapper rond UiTdatabank Search API.
     NB: Pas filters aan je noden aan; UiTdatabank ondersteunt veel meer parameters.
+    Geeft (items, meta) terug: de resultatenlijst en de overige top-level velden.
     """
-    params, headers = _auth_params_and_headers()
-    # Basisfilters
-    if q:
-        params["q"] = q
-    # Note: UiTdatabank API doesn't support size/page parameters
-    # API returns default pagination automatically
-    
-    # Add embed=true to get full event details instead of just references
-    params["embed"] = "true"
-
-    # Voorbeeld van extra filters (optioneel, afhankelijk van SAPI capabilities)
-    if start:
-        params["dateFrom"] = start  # ISO-8601 (bv. 2025-09-01)
-    if end:
-        params["dateTo"] = end
-    if city:
-        params["addressLocality"] = city
-
-    url = f"{UITDB_BASE}/{endpoint}"
-    async with httpx.AsyncClient(timeout=20.0) as client:
-        r = await client.get(url, params=params, headers=headers)
-        r.raise_for_status()
-        return r.json()
-
-def _compact_event(e: Dict[str, Any]) -> Dict[str, Any]:
+    # Basisfilters + extra filters (optioneel, afhankelijk van SAPI capabilities)
+    optional = {
+        "q": q,
+        "dateFrom": start,  # ISO-8601 (bv. 2025-09-01)
+        "dateTo": end,
+        "addressLocality": city,
+    }
+    # UiTdatabank pagineert via start (offset) + limit
+    tail = urlencode({
+        "start": (page - 1) * limit,
+        "limit": limit,
+        **{k: v for k, v in optional.items() if v},
+    })
+
+    r = await _CLIENT.get(f"/{endpoint}?{_BASE_QS}&{tail}", headers=_AUTH_HEADERS)
+    r.raise_for_status()
+    # Bewust gebufferd: httpx voegt de chunks één keer samen en orjson parseert in één pass.
+    # Streaming (ijson) is trager in Python en verliest de top-level meta; aiter_raw slaat gzip-decoding over.
+    raw = orjson.loads(r.content)
+    # Probeer generiek 'items' / 'member' / 'results' op te vangen.
+    # raw is hier nog vers, dus in place strippen i.p.v. een kopie te maken.
+    items = raw.pop("items", None)
+    member = raw.pop("member", None)
+    results = raw.pop("results", None)
+    return items or member or results or [], raw
+
+@dataclass(slots=True)
+class CompactEvent:
+    """Compacte weergave van één event; slots i.p.v. een dict per event."""
+    id: Optional[str]
+    name: Any  # nl/en naam, of de ruwe waarde als die ontbreekt
+    startDate: Optional[str]
+    endDate: Optional[str]
+    status: Optional[str]
+    url: Optional[str]
+    location: str
+    organizer: str
+
+def _compact_event(e: Dict[str, Any]) -> CompactEvent:
     """
     Maak resultaten compacter/leesbaar voor embed=true response.
     Extraheert de belangrijkste velden uit volledige embedded event data.
     """
-    def g(obj, *path, default=None):
-        cur = obj
-        for p in path:
-            if isinstance(cur, dict) and p in cur:
-                cur = cur[p]
-            else:
-                return default
-        return cur
+    name = e.get("name")
+    if isinstance(name, dict):
+        name = name.get("nl") or name.get("en") or name
 
-    return {
-        "id": e.get("@id"),  # Updated: use @id instead of id
-        "name": g(e, "name", "nl", default=g(e, "name", "en", default=e.get("name"))),
-        "startDate": e.get("startDate"),  # Updated: direct access instead of calendar.startDate
-        "endDate": e.get("endDate"),      # Updated: direct access instead of calendar.endDate
-        "status": g(e, "status", "type"), 
-        "url": e.get("@id"),  # Use @id as URL since no separate url field
-        "location": g(e, "location", "name", "nl", default=g(e, "location", "name", "en", default="Geen locatie")),  # Updated: embedded location
-        "organizer": g(e, "organizer", "name", "nl", default=g(e, "organizer", "name", "en", default="Geen organizer")),  # Updated: embedded organizer
-    }
+    status = e.get("status")
+    status = status.get("type") if isinstance(status, dict) else None
+
+    location = e.get("location")
+    location = location.get("name") if isinstance(location, dict) else None
+    if isinstance(location, dict):
+        location = location.get("nl") or location.get("en") or "Geen locatie"
+    else:
+        location = "Geen locatie"
+
+    organizer = e.get("organizer")
+    organizer = organizer.get("name") if isinstance(organizer, dict) else None
+    if isinstance(organizer, dict):
+        organizer = organizer.get("nl") or organizer.get("en") or "Geen organizer"
+    else:
+        organizer = "Geen organizer"
+
+    return CompactEvent(
+        id=e.get("@id"),  # Updated: use @id instead of id
+        name=name,
+        startDate=e.get("startDate"),  # Updated: direct access instead of calendar.startDate
+        endDate=e.get("endDate"),      # Updated: direct access instead of calendar.endDate
+        status=status,
+        url=e.get("@id"),  # Use @id as URL since no separate url field
+        location=location,  # Updated: embedded location
+        organizer=organizer,  # Updated: embedded organizer
+    )
 
-@mcp.tool
 async def search_uit(
     endpoint: Literal["events", "places", "organizers"],
     q: Optional[str] = None,
@@ -100,6 +169,7 @@ async def search_uit(
     start: Optional[str] = None,
     end: Optional[str] = None,
     city: Optional[str] = None,
+    pages: int = 1,
 ) -> dict:
     """
     Doorzoek de UiTdatabank Search API.
@@ -107,37 +177,86 @@ async def search_uit(
     Args:
       endpoint: 'events' | 'places' | 'organizers'
       q: vrije zoekterm
-      limit: aantal items per pagina (default 10)
+      limit: aantal items per pagina (default 10, max 100)
       page: paginanummer (default 1)
       start: ISO startdatum (bv '2025-09-01')
       end: ISO einddatum
       city: filter op stad (indien ondersteund)
+      pages: aantal opeenvolgende pagina's vanaf 'page', parallel opgehaald (default 1, max 10)
 
     Returns:
       Compacte JSON met de belangrijkste velden.
     """
-    raw = await _uitdb_search(endpoint, q=q, limit=limit, page=page, start=start, end=end, city=city)
-    # Probeer generiek 'items' / 'member' / 'results' op te vangen
-    items = raw.get("items") or raw.get("member") or raw.get("results") or []
+    # page/limit bepalen de offset upstream; ongeldige waarden geeft de API een foutstatus
+    if page < 1:
+        raise ValueError(f"page moet >= 1 zijn (kreeg {page})")
+    if not 1 <= limit <= _MAX_LIMIT:
+        raise ValueError(f"limit moet tussen 1 en {_MAX_LIMIT} liggen (kreeg {limit})")
+    if not 1 <= pages <= _MAX_PAGES:
+        raise ValueError(f"pages moet tussen 1 en {_MAX_PAGES} liggen (kreeg {pages})")
+    results = await asyncio.gather(*(
+        _uitdb_search(endpoint, q=q, limit=limit, page=p, start=start, end=end, city=city)
+        for p in range(page, page + pages)
+    ))
+    items = [item for page_items, _ in results for item in page_items]
     # Compacteer events alleen voor 'events'; voor andere endpoints returnen we raw items
     if endpoint == "events":
-        compact = [_compact_event(e) for e in items]
+        compact = list(map(_compact_event, items))
     else:
         compact = items
     return {
         "endpoint": endpoint,
         "count": len(compact),
         "page": page,
+        "pages": len(results),
         "data": compact,
-        "raw_meta": {k: v for k, v in raw.items() if k not in ("items", "member", "results")},
+        "raw_meta": results[0][1],
     }
 
-# === FastAPI app + MCP over HTTP/SSE ===
-app = FastAPI()
+# === FastAPI app + MCP over streamable HTTP ===
+def create_app():
+    """
+    Bouw de FastAPI app met de MCP server op /mcp.
+    FastAPI en FastMCP worden pas hier geïmporteerd, zodat het importeren van
+    deze module (en een cold start) die kost niet betaalt.
+    """
+    from fastapi import FastAPI
+    from fastapi.middleware.gzip import GZipMiddleware
+    from fastmcp import FastMCP
+
+    mcp = FastMCP("uitdb")
+    mcp.tool(search_uit)
+
+    # Stateless, zodat elke uvicorn worker elke request kan afhandelen.
+    # json_response: gewone JSON body i.p.v. een SSE stream per tool call (comprimeerbaar met gzip)
+    mcp_app = mcp.http_app(path="/", stateless_http=True, json_response=True)
+
+    @asynccontextmanager
+    async def _lifespan(app):
+        global _CLIENT
+        _CLIENT = httpx.AsyncClient(
+            base_url=UITDB_BASE,
+            http2=True,
+            timeout=httpx.Timeout(20.0),
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30.0),
+            headers={"Accept": "application/json"},
+        )
+        try:
+            # De FastMCP session manager moet mee opstarten met de FastAPI app
+            async with mcp_app.lifespan(app):
+                yield
+        finally:
+            await _CLIENT.aclose()
+
+    app = FastAPI(lifespan=_lifespan)
+    # Grote 'data' arrays gecomprimeerd over de lijn, voor clients die gzip accepteren
+    app.add_middleware(GZipMiddleware, minimum_size=1000)
+
+    # Mount FastMCP op /mcp; het endpoint is /mcp/ (zonder slash volgt een 307 redirect)
+    app.mount("/mcp", mcp_app)
 
-# Mount FastMCP op /mcp (SSE/HTTP transport)
-app.mount("/mcp", mcp.http_app)
+    @app.get("/")
+    def health():
+        return {"ok": True, "service": "uitdb-mcp", "mcp_endpoint": "/mcp/"}
 
-@app.get("/")
-def health():
-    return {"ok": True, "service": "uitdb-mcp", "mcp_endpoint": "/mcp"}
+    return app